@@ -1,5 +1,6 @@
 import random
 import json
+import pickle
 import argparse
 import tempfile
 import subprocess
@@ -232,7 +233,8 @@ def parse_args():
                     "matrices and use neighbor-joining."
     )
     parser.add_argument("json", type=str,
-                        help="input, JSON file")
+                        help="input, pickle (.pkl) or JSON file of recoded lineage data, "
+                             "written by make_beadplots()")
     parser.add_argument("lineage", type=str,
                         help="input, name of lineage to process ('deep' mode) or path to "
                              "text file of minor lineage names ('flat' mode)")
@@ -261,7 +263,7 @@ def parse_args():
 def unpack_recoded(recoded, lineage, callback=None):
     """
     Recover dictionary from JSON.
-    :param recoded:  dict, directly returned from json.load
+    :param recoded:  dict, directly returned from pickle.load or json.load
     :param lineage:  str, PANGO lineage specifier
     :param callback:  optional callback function
     """
@@ -306,8 +308,11 @@ if __name__ == "__main__":
     cb = Callback(t0=args.timestamp, my_rank=my_rank, nprocs=nprocs)
 
     # import lineage data from file
-    with open(args.json) as handle:
-        recoded = json.load(handle)
+    with open(args.json, 'rb') as handle:
+        if args.json.endswith('.pkl'):
+            recoded = pickle.load(handle)
+        else:
+            recoded = json.load(handle)
 
     if args.mode == 'deep':
         union, labels, indexed = unpack_recoded(recoded, args.lineage, callback=cb.callback)
@@ -4,9 +4,15 @@ import re
 import sys
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import covizu
 import covizu.utils.gisaid_utils
+from covizu.utils.seq_utils import iter_fasta
+
+
+MM_F_EQX = 0x4000000  # mappy extra_flags equivalent of --eqx
+COMPLEMENT = str.maketrans('ACGTRYKMBDHVN', 'TGCAYRMKVHDBN')
 
 
 def apply_cigar(seq, rpos, cigar):
@@ -34,7 +40,8 @@ def apply_cigar(seq, rpos, cigar):
     return aligned
 
 
-def minimap2(infile, ref, stream=False, path='minimap2', nthread=3, minlen=29000):
+def minimap2(infile, ref, stream=False, path='minimap2', nthread=3, minlen=29000,
+             kbatch=None, cap_kalloc=None):
     """
     Wrapper function for minimap2.
 
@@ -44,22 +51,35 @@ def minimap2(infile, ref, stream=False, path='minimap2', nthread=3, minlen=29000
     :param path:  str, path to binary executable
     :param nthread:  int, number of threads for parallel execution of minimap2
     :param minlen:  int, filter genomes below minimum length; to accept all, set to 0.
+    :param kbatch:  str, number of bases loaded into memory per mini-batch (-K),
+                    e.g., '500M'; defaults to minimap2 setting
+    :param cap_kalloc:  str, cap on thread-local memory (--cap-kalloc), e.g.,
+                        '2000m'; defaults to minimap2 setting
 
     :yield:  query sequence name, reference index, CIGAR and original
              sequence
     """
+    cmd = [path, '-t', str(nthread), '-a', '--eqx']
+    if kbatch is not None:
+        cmd.extend(['-K', str(kbatch)])
+    if cap_kalloc is not None:
+        cmd.extend(['--cap-kalloc', str(cap_kalloc)])
+
     if stream:
         # input from StringIO in memory
         p = subprocess.Popen(
-            [path, '-t', str(nthread), '-a', '--eqx', ref, '-'], encoding='utf8',
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            cmd + [ref, '-'], encoding='utf8',
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
         output, outerr = p.communicate(infile)
+        if p.returncode != 0:
+            raise RuntimeError('minimap2 exited with code {}: {}'.format(
+                p.returncode, outerr.strip()))
         output = output.split('\n')
     else:
         # input read from file
         p = subprocess.Popen(
-            [path, '-t', str(nthread), '-a', '--eqx', ref, infile.name],
+            cmd + [ref, infile.name],
             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
         )
         output = map(lambda x: x.decode('utf-8'), p.stdout)
@@ -87,6 +107,52 @@ def minimap2(infile, ref, stream=False, path='minimap2', nthread=3, minlen=29000
         rpos = int(rpos) - 1  # convert to 0-index
         yield qname, rpos, cigar, seq
 
+    if not stream and p.wait() != 0:
+        raise RuntimeError('minimap2 exited with code {}'.format(p.returncode))
+
+
+def mappy_align(infile, aligner, nthread=3, minlen=29000):
+    """
+    Align sequences in-process with the minimap2 Python bindings (mappy),
+    re-using an index that is built once by the caller.  Output matches
+    the primary alignments from minimap2() with --eqx, so it can be
+    passed to encode_diffs().
+
+    :param infile:  str, FASTA-formatted text, e.g., from batch_fasta()
+    :param aligner:  mappy.Aligner, index of the reference genome, built
+                     with extra_flags=MM_F_EQX
+    :param nthread:  int, number of threads for parallel alignment
+    :param minlen:  int, filter genomes below minimum length; to accept all, set to 0.
+
+    :yield:  query sequence name, reference index, CIGAR and original
+             sequence
+    """
+    def align(record):
+        qname, seq = record
+        if len(seq) < minlen:
+            # reject sequence that is too short
+            return None
+        for hit in aligner.map(seq):
+            if not hit.is_primary:
+                continue
+            # restore soft clips, which mappy reports as query coordinates
+            left, right = hit.q_st, len(seq) - hit.q_en
+            if hit.strand < 0:
+                seq = seq.translate(COMPLEMENT)[::-1]
+                left, right = right, left
+            cigar = hit.cigar_str
+            if left:
+                cigar = '{}S{}'.format(left, cigar)
+            if right:
+                cigar = '{}{}S'.format(cigar, right)
+            return qname, hit.r_st, cigar, seq
+        return None  # did not map
+
+    with ThreadPoolExecutor(max_workers=nthread) as executor:
+        for row in executor.map(align, iter_fasta(infile.splitlines())):
+            if row is not None:
+                yield row
+
 
 # return aligned sequence?
 def output_fasta(iter, outfile, reflen=0):
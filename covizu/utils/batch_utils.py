@@ -3,6 +3,7 @@ from Bio import Phylo
 from covizu import clustering, beadplot
 import sys
 import json
+import pickle
 import covizu.treetime
 
 
@@ -135,7 +136,7 @@ def import_labels(handle, callback=None):
 
 
 def make_beadplots(by_lineage, args, callback=None, t0=None, txtfile='minor_lineages.txt',
-                   recode_file="recoded.json"):
+                   recode_file="recoded.pkl"):
     """
     Wrapper for beadplot_serial - divert to clustering.py in MPI mode if
     lineage has too many genomes.
@@ -144,7 +145,7 @@ def make_beadplots(by_lineage, args, callback=None, t0=None, txtfile='minor_line
     :param args:  Namespace, from argparse.ArgumentParser()
     :param t0:  float, datetime.timestamp.
     :param txtfile:  str, path to file to write minor lineage names
-    :param recode_file:  str, path to JSON file to write recoded lineage data
+    :param recode_file:  str, path to pickle file to write recoded lineage data
 
     :return:  list, beadplot data by lineage
     """
@@ -162,8 +163,9 @@ def make_beadplots(by_lineage, args, callback=None, t0=None, txtfile='minor_line
         recoded.update({lineage: {'union': union, 'labels': labels,
                                   'indexed': indexed}})
 
-    with open(recode_file, 'w') as handle:
-        json.dump(recoded, handle)
+    # pickle is much faster to load than JSON, for every MPI process
+    with open(recode_file, 'wb') as handle:
+        pickle.dump(recoded, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
     # partition lineages into major and minor categories
     intermed = [(len(features), lineage) for lineage, features in by_lineage.items()
@@ -180,7 +182,7 @@ def make_beadplots(by_lineage, args, callback=None, t0=None, txtfile='minor_line
     if callback:
         callback("start MPI on minor lineages")
     cmd = ["mpirun", "--machinefile", args.machine_file, "python3", "covizu/clustering.py",
-           recode_file, txtfile,  # positional arguments <JSON file>, <str>
+           recode_file, txtfile,  # positional arguments <pickle file>, <str>
            "--mode", "flat",
            "--max-variants", str(args.max_variants),
            "--nboot", str(args.nboot),
@@ -201,7 +203,7 @@ def make_beadplots(by_lineage, args, callback=None, t0=None, txtfile='minor_line
 
         cmd = [
             "mpirun", "--machinefile", args.machine_file, "python3", "covizu/clustering.py",
-            recode_file, lineage,  # positional arguments <JSON file>, <str>
+            recode_file, lineage,  # positional arguments <pickle file>, <str>
             "--mode", "deep",
             "--max-variants", str(args.max_variants),
             "--nboot", str(args.nboot),
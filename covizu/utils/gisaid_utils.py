@@ -7,6 +7,8 @@ import sys
 import subprocess
 from datetime import datetime
 import getpass
+import queue
+import threading
 
 import covizu
 from covizu import minimap2
@@ -102,6 +104,64 @@ def load_gisaid(path, minlen=29000, mindate='2019-12-01', callback=None,
                  "         {nonhuman} non-human genomes".format(**rejects))
 
 
+def threaded_stream(gen, maxsize=1000):
+    """
+    Consume a generator in a background thread through a bounded queue, so
+    that upstream parsing runs concurrently with downstream processing
+    (e.g., minimap2).  Exceptions raised in <gen>, including SystemExit,
+    are re-raised in the calling thread.
+    :param gen:  generator, e.g., return value of load_gisaid()
+    :param maxsize:  int, maximum number of records held in queue
+    :yield:  records from <gen>, in the same order
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()  # sentinel
+    errors = []
+
+    def producer():
+        try:
+            for record in gen:
+                buffer.put(record)
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            buffer.put(done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    while True:
+        record = buffer.get()
+        if record is done:
+            break
+        yield record
+
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def sort_by_length(gen, size=100, nbatch=10):
+    """
+    Buffer records from stream and re-emit them in descending order of
+    sequence length, so that genomes of similar length end up in the same
+    minimap2 batch.
+    :param gen:  generator, return value of load_gisaid()
+    :param size:  int, number of records per batch
+    :param nbatch:  int, number of batches to buffer and sort
+    :yield:  dict, records in the same format as <gen>
+    """
+    buffer = []
+    for record in gen:
+        buffer.append(record)
+        if len(buffer) == size * nbatch:
+            buffer.sort(key=lambda r: len(r['sequence']), reverse=True)
+            yield from buffer
+            buffer = []
+
+    buffer.sort(key=lambda r: len(r['sequence']), reverse=True)
+    yield from buffer
+
+
 def batch_fasta(gen, size=100):
     """
     Concatenate sequence records in stream into FASTA-formatted text in batches of
@@ -126,25 +186,38 @@ def batch_fasta(gen, size=100):
         yield stdin, batch
 
 
-def extract_features(batcher, ref_file, binpath='minimap2', nthread=3, minlen=29000):
+def extract_features(batcher, ref_file, binpath='minimap2', nthread=3, minlen=29000,
+                     kbatch=None, cap_kalloc=None, aligner=None):
     """
     Stream output from JSON.xz file via load_gisaid() into minimap2
-    via subprocess.
+    via subprocess, or into a mappy index if <aligner> is given.
 
     :param batcher:  generator, returned by batch_fasta()
     :param ref_file:  str, path to reference genome (FASTA format)
     :param binpath:  str, path to minimap2 binary executable
     :param nthread:  int, number of threads to run minimap2
     :param minlen:  int, minimum genome length
+    :param kbatch:  str, minimap2 mini-batch size (-K), e.g., '500M'
+    :param cap_kalloc:  str, minimap2 thread-local memory cap (--cap-kalloc)
+    :param aligner:  mappy.Aligner, optional index of <ref_file> built with
+                     extra_flags=minimap2.MM_F_EQX; if given, align in-process
+                     instead of calling the minimap2 binary
 
     :yield:  dict, record augmented with genetic differences and missing sites;
     """
-    with open(ref_file) as handle:
-        reflen = len(convert_fasta(handle)[0][1])
+    if aligner is None:
+        with open(ref_file) as handle:
+            reflen = len(convert_fasta(handle)[0][1])
+    else:
+        # reuse reference sequence held by the index
+        reflen = len(aligner.seq(aligner.seq_names[0]))
 
     for fasta, batch in batcher:
-        mm2 = minimap2.minimap2(fasta, ref_file, stream=True, path=binpath, nthread=nthread,
-                       minlen=minlen)
+        if aligner is None:
+            mm2 = minimap2.minimap2(fasta, ref_file, stream=True, path=binpath, nthread=nthread,
+                                    minlen=minlen, kbatch=kbatch, cap_kalloc=cap_kalloc)
+        else:
+            mm2 = minimap2.mappy_align(fasta, aligner, nthread=nthread, minlen=minlen)
         result = list(minimap2.encode_diffs(mm2, reflen=reflen))
         for row, record in zip(result, batch):
             # reconcile minimap2 output with GISAID record
@@ -1,5 +1,8 @@
 from datetime import date
 import bisect
+import io
+import subprocess
+from contextlib import contextmanager
 import pkg_resources
 
 from scipy.stats import poisson
@@ -39,6 +42,40 @@ def parse_label(label):
         raise
 
 
+@contextmanager
+def open_fasta(path, bufsize=4 << 20):
+    """
+    Open FASTA file for reading.  If the file is xz- or gzip-compressed,
+    decompress it in a separate process (xzcat or pigz) and read the
+    uncompressed stream from a pipe, so decompression runs in parallel
+    with parsing.
+
+    :param path:  str, path to FASTA file, optionally with .xz or .gz extension
+    :param bufsize:  int, read buffer size in bytes
+    :yield:  open text stream to uncompressed FASTA
+    """
+    if path.endswith('.xz'):
+        cmd = ['xzcat', '-T0', path]
+    elif path.endswith('.gz'):
+        cmd = ['pigz', '-dc', path]
+    else:
+        with open(path, buffering=bufsize) as handle:
+            yield handle
+        return
+
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=bufsize)
+    except FileNotFoundError as err:
+        raise FileNotFoundError("{} is required to read {}".format(cmd[0], path)) from err
+    try:
+        yield io.TextIOWrapper(proc.stdout)
+    finally:
+        proc.stdout.close()
+        if proc.wait() > 0:
+            # negative return code if stream was closed early (SIGPIPE)
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
 def iter_fasta(handle):
     """
     Parse open file as FASTA.  Returns a generator
@@ -59,6 +96,30 @@ def iter_fasta(handle):
     yield h, sequence
 
 
+def iter_fasta_screened(handle, accept):
+    """
+    Parse open file as FASTA, calling <accept> on each header as its
+    record starts.  Sequence lines of rejected records are skipped without
+    being accumulated, so only accepted sequences are built.  Follows
+    Bio.SeqIO.FastaIO.SimpleFastaParser otherwise.
+
+    :param handle:  open stream to FASTA file in read mode
+    :param accept:  function, takes header (str) and returns True to keep record
+    :yield tuples, (header, sequence) of accepted records
+    """
+    header, lines = None, None  # lines is None while skipping
+    for line in handle:
+        if line[0] == '>':
+            if lines is not None:
+                yield header, ''.join(lines)
+            header = line[1:].rstrip()
+            lines = [] if accept(header) else None
+        elif lines is not None:
+            lines.append(line.rstrip())
+    if lines is not None:
+        yield header, ''.join(lines)
+
+
 def convert_fasta(handle):
     """
     Parse FASTA file as a list of header, sequence list objects
@@ -120,7 +181,7 @@ def apply_features(diffs, missing, refseq):
 
 
 def fromisoformat(dt):
-    """ Convert ISO date to Python datetime.date object to support Python <3.7 """
+    """ Convert ISO date to Python datetime.date object, or None if date is incomplete """
     try:
         year, month, day = map(int, dt.split('-'))
     except ValueError:
@@ -1,25 +1,38 @@
 import argparse
+import functools
 import os
+import re
 import sys
 import json
 from datetime import datetime, date
-from csv import DictReader
+
+import mappy
+import orjson
+import pandas as pd
 
 import covizu
+from covizu import minimap2
 from covizu.utils import seq_utils, gisaid_utils
 from covizu.utils.progress_utils import Callback
 from covizu.utils.batch_utils import *
 from covizu.utils.seq_utils import SC2Locator
 
 
+# expected header row of Pangolin CSV output
+PANGOLIN_HEADER = ('taxon', 'lineage', 'probability', 'pangoLEARN_version', 'status', 'note')
+
+# complete collection date, YYYY-MM-DD
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="CoVizu analysis pipeline automation for execution on local files"
     )
 
     parser.add_argument("infile", type=str,
-                        help="input, path to xz-compressed JSON; if not specified, "
-                             "download xz file from GISAID provision feed.")
+                        help="input, path to FASTA file of genome sequences, optionally "
+                             "xz- or gzip-compressed (requires xzcat or pigz)")
     parser.add_argument("pangolineages", type=argparse.FileType('r'),
                         help="input, CSV output generated by Pangolin")
     parser.add_argument("--outdir", type=str, default='data/',
@@ -43,6 +56,9 @@ def parse_args():
 
     parser.add_argument('--batchsize', type=int, default=500,
                         help='number of records to batch process with minimap2')
+    parser.add_argument('--sort-batches', type=int, default=10,
+                        help='number of batches to buffer and sort by sequence length '
+                             'before alignment (default 10)')
     parser.add_argument('--max-variants', type=int, default=5000,
                         help='option, limit number of variants per lineage (default 5000)')
 
@@ -50,9 +66,20 @@ def parse_args():
                         default=os.path.join(covizu.__path__[0], "data/NC_045512.fa"),
                         help="path to FASTA file with reference genome")
     parser.add_argument('--mmbin', type=str, default='minimap2',
-                        help="path to minimap2 binary executable")
+                        help="path to minimap2 binary executable, used with --no-mappy")
+    parser.add_argument('--no-mappy', action='store_true',
+                        help="call minimap2 binary via subprocess instead of aligning "
+                             "in-process with mappy")
     parser.add_argument('-mmt', "--mmthreads", type=int, default=8,
                         help="number of threads for minimap2.")
+    parser.add_argument('--mm-K', type=str, default=None,
+                        help="number of bases loaded into memory per minimap2 "
+                             "mini-batch (-K, e.g., 2G), used with --no-mappy; "
+                             "defaults to minimap2 setting")
+    parser.add_argument('--mm-cap-kalloc', type=str, default=None,
+                        help="cap on minimap2 thread-local memory (--cap-kalloc, "
+                             "e.g., 2000m, requires minimap2 2.22+), used with "
+                             "--no-mappy; defaults to minimap2 setting")
 
     parser.add_argument('--misstol', type=int, default=300,
                         help="maximum tolerated number of missing bases per "
@@ -94,76 +121,133 @@ def parse_args():
     return parser.parse_args()
 
 
-def stream_local(path, lineage_file, minlen=29000, mindate='2019-12-01', callback=None):
+@functools.lru_cache(maxsize=4096)
+def parse_date(coldate):
+    """
+    Cached ISO date parsing - few distinct collection dates recur across genomes.
+    Only accepts complete YYYY-MM-DD dates; Python 3.11+ date.fromisoformat also
+    parses compact and ISO week dates, which seq_utils.fromisoformat cannot read
+    downstream.
+    """
+    if not ISO_DATE.fullmatch(coldate):
+        raise ValueError("Expected YYYY-MM-DD date, got {!r}".format(coldate))
+    return date.fromisoformat(coldate)
+
+
+def screen_header(header, mindate, today):
+    """
+    Apply basic filters to a FASTA header of the form
+    hCoV-19/Canada/Qc-L00240569/2020|EPI_ISL_465679|2020-03-27
+
+    :param header:  str, FASTA header without leading '>'
+    :param mindate:  datetime.date, earliest reasonable sample collection date
+    :param today:  datetime.date, latest reasonable sample collection date
+    :return:  str, key of rejection category; None if header is accepted
+    """
+    label, sep1, rest = header.partition('|')
+    accn, sep2, coldate = rest.partition('|')
+    if not (sep1 and sep2):
+        return 'badheader'  # missing accession or collection date
+
+    country = label.split('/')[1]
+    if country == '' or country[0].islower():
+        return 'nonhuman'
+
+    try:
+        dt = parse_date(coldate)
+    except ValueError:
+        return 'baddate'  # incomplete collection date
+    if dt < mindate or dt > today:
+        return 'baddate'  # reject records with non-sensical collection date
+    return None
+
+
+def stream_local(path, lineage_file, minlen=29000, mindate='2019-12-01', callback=None,
+                 chunksize=100000):
     """ Convert local FASTA file to feed-like object - replaces load_gisaid() """
-    mindate = seq_utils.fromisoformat(mindate)
+    mindate = date.fromisoformat(mindate)
+    today = date.today()
 
     # parse CSV output from Pangolin
-    reader = DictReader(lineage_file)
-    if reader.fieldnames != ['taxon', 'lineage', 'probability', 'pangoLEARN_version', 'status', 'note']:
+    if tuple(lineage_file.readline().rstrip().split(',')) != PANGOLIN_HEADER:
         if callback:
             callback("Lineage CSV header does not match expected.", level='ERROR')
         sys.exit()
 
+    # stream the two columns we need in chunks, keeping empty lineages as ''
     lineages = {}
-    for row in reader:
-        lineages.update({row['taxon']: row['lineage']})
-
-    handle = open(path)
-    rejects = {'short': 0, 'baddate': 0, 'nonhuman': 0}
-    for header, seq in seq_utils.iter_fasta(handle):
-        if len(seq) < minlen:
-            rejects['short'] += 1
-            continue  # sequence is too short
-
-        # hCoV-19/Canada/Qc-L00240569/2020|EPI_ISL_465679|2020-03-27
-        label, accn, coldate = header.split('|')
-        country = label.split('/')[1]
-        if country == '' or country[0].islower():
-            rejects['nonhuman'] += 1
-            continue
-
-        if coldate.count('-') != 2:
-            rejects['baddate'] += 1
-            continue  # incomplete collection date
-        dt = seq_utils.fromisoformat(coldate)
-        if dt < mindate or dt > date.today():
-            rejects['baddate'] += 1
-            continue  # reject records with non-sensical collection date
-
-        lineage = lineages.get(header, None)
-        if lineage is None:
-            if callback:
-                callback(
-                    "Failed to retrieve lineage assignment for {}".format(header),
-                    level='ERROR'
-                )
-            sys.exit()
-
-        record = {
-            'covv_virus_name': label,
-            'covv_accession_id': accn,
-            'sequence': seq,
-            'covv_collection_date': coldate,
-            'covv_lineage': lineage
-        }
-        yield record
+    for chunk in pd.read_csv(lineage_file, header=None, names=PANGOLIN_HEADER,
+                             usecols=['taxon', 'lineage'], dtype=str, na_filter=False,
+                             chunksize=chunksize):
+        # taxa are FASTA headers - skip assignments for genomes that the
+        # header screen will reject anyway, sharing one string object per
+        # distinct lineage among the rest
+        lineages.update(
+            (taxon, sys.intern(lineage))
+            for taxon, lineage in zip(chunk['taxon'].values, chunk['lineage'].values)
+            if screen_header(taxon, mindate, today) is None
+        )
+
+    rejects = {'short': 0, 'baddate': 0, 'nonhuman': 0, 'badheader': 0}
+
+    def accept(header):
+        # screen header before its sequence is loaded
+        reason = screen_header(header, mindate, today)
+        if reason is None:
+            return True
+        rejects[reason] += 1
+        return False
+
+    with seq_utils.open_fasta(path) as handle:
+        for header, seq in seq_utils.iter_fasta_screened(handle, accept):
+            seq = seq.upper()
+            if len(seq) < minlen:
+                rejects['short'] += 1
+                continue  # sequence is too short
+
+            lineage = lineages.get(header, None)
+            if lineage is None:
+                if callback:
+                    callback(
+                        "Failed to retrieve lineage assignment for {}".format(header),
+                        level='ERROR'
+                    )
+                sys.exit()
+
+            label, _, rest = header.partition('|')
+            accn, _, coldate = rest.partition('|')
+            record = {
+                'covv_virus_name': label,
+                'covv_accession_id': accn,
+                'sequence': seq,
+                'covv_collection_date': sys.intern(coldate),
+                'covv_lineage': lineage
+            }
+            yield record
 
     if callback:
         callback("Rejected {short} short genomes\n         {baddate} records with bad "
-                 "dates\n         {nonhuman} non-human genomes".format(**rejects))
+                 "dates\n         {nonhuman} non-human genomes\n         {badheader} "
+                 "malformed headers".format(**rejects))
 
 
 def process_local(args, callback=None):
     """ Analyze genome sequences from local FASTA file """
-    with open(args.ref) as handle:
-        reflen = len(seq_utils.convert_fasta(handle)[0][1])
+    aligner = None
+    if not args.no_mappy:
+        # build reference index once for all batches
+        aligner = mappy.Aligner(args.ref, n_threads=args.mmthreads,
+                                extra_flags=minimap2.MM_F_EQX)
 
     loader = stream_local(args.infile, args.pangolineages, minlen=args.minlen,
                           mindate=args.mindate, callback=callback)
+    loader = gisaid_utils.threaded_stream(loader, maxsize=4*args.batchsize)
+    loader = gisaid_utils.sort_by_length(loader, size=args.batchsize, nbatch=args.sort_batches)
     batcher = gisaid_utils.batch_fasta(loader, size=args.batchsize)
     aligned = gisaid_utils.extract_features(batcher, ref_file=args.ref, binpath=args.mmbin,
-                                            nthread=args.mmthreads, minlen=args.minlen)
+                                            nthread=args.mmthreads, minlen=args.minlen,
+                                            kbatch=args.mm_K, cap_kalloc=args.mm_cap_kalloc,
+                                            aligner=aligner)
     filtered = gisaid_utils.filter_problematic(aligned, vcf_file=args.vcf, cutoff=args.poisson_cutoff,
                                                callback=callback)
     return gisaid_utils.sort_by_lineage(filtered, callback=callback)
@@ -197,9 +281,16 @@ if __name__ == "__main__":
         sys.exit()
 
     by_lineage = process_local(args, cb.callback)
-    with open(args.bylineage, 'w') as handle:
-        # export to file to process large lineages with MPI
-        json.dump(by_lineage, handle)
+    with open(args.bylineage, 'wb') as handle:
+        # export to file one lineage at a time, to cap memory used by serialization
+        handle.write(b'{')
+        for i, (lineage, features) in enumerate(by_lineage.items()):
+            if i:
+                handle.write(b',')
+            handle.write(orjson.dumps(lineage))
+            handle.write(b':')
+            handle.write(orjson.dumps(features))
+        handle.write(b'}')
 
     # reconstruct time-scaled tree
     timetree, residuals = build_timetree(by_lineage, args, cb.callback)
@@ -210,8 +301,8 @@ if __name__ == "__main__":
 
     # generate beadplots and serialize to file
     result = make_beadplots(by_lineage, args, cb.callback, t0=cb.t0.timestamp())
-    outfile = open(os.path.join(args.outdir, 'clusters.{}.json'.format(timestamp)), 'w')
-    outfile.write(json.dumps(result))  # serialize results to JSON
+    outfile = open(os.path.join(args.outdir, 'clusters.{}.json'.format(timestamp)), 'wb')
+    outfile.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY))  # serialize results to JSON
     outfile.close()
 
     # get mutation info
@@ -1,15 +1,17 @@
 import functools
-import json
+from collections import defaultdict
 import logging
+import multiprocessing
 import os
 import re
 import sys
 
+import orjson
+
 
 # define path to working directory
 path = "./" # path to cloned pokay directory
 text_indir = path + "data" # path to ./data folder in pokay directory
-mut_dict = {}
 
 
 # sub function to sort constellations by position
@@ -165,61 +167,46 @@ def pokay_mut_annotations():
 # new format => aa, gene, refAA, codon, queryAA
 def reformatMutations(subt, dels, func):
 
-    # define list & dictionary object
-    # to store data
-    mut_list = []
+    # keyed by mutations, sets drop duplicate descriptions
+    mut_dict = defaultdict(set)
 
     # iterate through mutations
-    for c, i in enumerate(subt):
-        subs = i
-        muts = "{}:{}:{}{}{}".format("aa",subs["gene"], subs["refAA"], subs["codon"], subs["queryAA"])
-        mut_list.append(muts)
+    for subs in subt:
+        g, q, r, c = subs["gene"], subs["queryAA"], subs["refAA"], subs["codon"]
+        mut_dict[f"aa:{g}:{r}{c}{q}"].add(func)
 
     # iterate through deletions if any
-    for n, j in enumerate(dels):
-        if dels == "None":
-            dells = []
-        else:
-            dell = j
-            dells = "{}:{}:{}{}{}".format("aa", dell["gene"], dell["refAA"], dell["codon"], "-")
-            mut_list.append(dells)
-
-    # keyed by mutations
-    for mut in mut_list:
-        if mut not in mut_dict:
-            mut_dict[mut] = [func]
-        elif func not in mut_dict[mut]:
-            mut_dict[mut].append(func)
-
-
-# get JSON object from pokay directory
-data = pokay_mut_annotations()
-
-# output JSON
-outfile = open(path + 'mut_annotations.json', 'w')
-
-# iterating through pokay generated mutation annotations
-for i in range(0, len(data)):
-    subs = data[i]["substitutions"]
-    dels = data[i]["deletions"]
-    func = data[i]["description"]
-
-    #run function
-    reformatMutations(subs, dels, func)
-    
-# write result to JSON file
-json.dump(mut_dict, outfile, indent=4, ensure_ascii=False, separators=(',', ':'))
-
-# closing files
-outfile.close()
-
-
-# fix JSON file issues, add commas
-# and a square brackets at the begin and end of file
-# with open(path + "mut_annotations.json", "r+") as fyl:
-# 	edit_f = fyl.read()
-# 	fyl.seek(0)
-# 	j_son = '[' + edit_f  + ']'
-# 	j_son = j_son.replace('}{', '},{')
-# 	fyl.write(j_son)
-# 	fyl.close
\ No newline at end of file
+    if dels and dels != "None":
+        for dell in dels:
+            mut_dict[f"aa:{dell['gene']}:{dell['refAA']}{dell['codon']}-"].add(func)
+
+    return mut_dict
+
+
+# sub function to reformat one pokay annotation, run by worker processes
+def reformat_annotation(annotation):
+    return reformatMutations(annotation["substitutions"], annotation["deletions"],
+                             annotation["description"])
+
+
+if __name__ == "__main__":
+    # get JSON object from pokay directory
+    data = pokay_mut_annotations()
+
+    # reformat pokay generated mutation annotations in parallel
+    chunksize = max(1, len(data) // (multiprocessing.cpu_count() * 4))
+    with multiprocessing.Pool() as pool:
+        partials = pool.map(reformat_annotation, data, chunksize=chunksize)
+
+    # merge partial results
+    mut_dict = defaultdict(set)
+    for partial in partials:
+        for mut, funcs in partial.items():
+            mut_dict[mut] |= funcs
+
+    # sets cannot be serialized to JSON
+    mut_dict = {mut: sorted(funcs) for mut, funcs in mut_dict.items()}
+
+    # write result to JSON file
+    with open(path + 'mut_annotations.json', 'wb') as outfile:
+        outfile.write(orjson.dumps(mut_dict, option=orjson.OPT_INDENT_2))
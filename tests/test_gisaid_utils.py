@@ -1,4 +1,5 @@
 import unittest
+import mappy
 from covizu.utils.gisaid_utils import *
 
 
@@ -20,6 +21,32 @@ class TestLoadGISAID(unittest.TestCase):
         self.assertEqual(self.expectedRejects, result)
 
 
+class TestThreadedStream(unittest.TestCase):
+    def testThreadedStream(self):
+        gen = ({'covv_virus_name': str(i)} for i in range(100))
+        result = list(threaded_stream(gen, maxsize=7))
+        self.assertEqual([{'covv_virus_name': str(i)} for i in range(100)], result)
+
+    def testThreadedStreamExit(self):
+        def gen():
+            yield {'covv_virus_name': 'a'}
+            sys.exit()
+        with self.assertRaises(SystemExit):
+            list(threaded_stream(gen()))
+
+
+class TestSortByLength(unittest.TestCase):
+    def testSortByLength(self):
+        gen = [{'covv_virus_name': 'a', 'sequence': 'ACG'},
+               {'covv_virus_name': 'b', 'sequence': 'ACGTACGT'},
+               {'covv_virus_name': 'c', 'sequence': 'ACGTA'},
+               {'covv_virus_name': 'd', 'sequence': 'A'},
+               {'covv_virus_name': 'e', 'sequence': 'ACGTACGTAC'}]
+        # buffers of size * nbatch = 4 records are sorted independently
+        result = [r['covv_virus_name'] for r in sort_by_length(gen, size=2, nbatch=2)]
+        self.assertEqual(['b', 'c', 'a', 'd', 'e'], result)
+
+
 class TestBatchFasta(unittest.TestCase):
     def setUp(self):
         self.expected = \
@@ -80,6 +107,17 @@ class TestExtractFeatures(unittest.TestCase):
         result = list(extract_features(self.batcher, 'covizu/data/NC_045512.fa', binpath='/usr/local/bin/minimap2', nthread=3, minlen=40))
         self.assertEqual(self.expected, result)
 
+    def testExtractFeaturesFailure(self):
+        # non-zero exit from minimap2 must not be mistaken for empty output
+        with self.assertRaises(RuntimeError):
+            list(extract_features(self.batcher, 'covizu/data/NC_045512.fa', binpath='false', minlen=40))
+
+    def testExtractFeaturesMappy(self):
+        aligner = mappy.Aligner('covizu/data/NC_045512.fa', extra_flags=minimap2.MM_F_EQX)
+        result = list(extract_features(self.batcher, 'covizu/data/NC_045512.fa', nthread=3, minlen=40,
+                                       aligner=aligner))
+        self.assertEqual(self.expected, result)
+
 
 # Test Filter Problematic
 
@@ -0,0 +1,69 @@
+import unittest
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from local import parse_date, stream_local
+
+
+HEADER = "taxon,lineage,probability,pangoLEARN_version,status,note\n"
+
+
+class TestParseDate(unittest.TestCase):
+    def testParseDate(self):
+        self.assertEqual(date(2020, 3, 27), parse_date('2020-03-27'))
+
+    def testParseDateReject(self):
+        # accepted by date.fromisoformat in Python 3.11+
+        for coldate in ['20200327', '2020-W13-5', '2020W135', '2020-03']:
+            with self.assertRaises(ValueError):
+                parse_date(coldate)
+
+
+class TestStreamLocal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'test.fa')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def stream(self, records, lineages, minlen=10):
+        with open(self.path, 'w') as handle:
+            for header, seq in records:
+                handle.write('>{}\n{}\n'.format(header, seq))
+        csv = StringIO(HEADER + ''.join('{},{},1.0,v1,passed_qc,\n'.format(h, l)
+                                        for h, l in lineages))
+        return list(stream_local(self.path, csv, minlen=minlen))
+
+    def testStreamLocal(self):
+        header = 'hCoV-19/Canada/Qc-L00240569/2020|EPI_ISL_465679|2020-03-27'
+        result = self.stream([(header, 'acgtacgtacgt')], [(header, 'B.1')])
+        expected = [{'covv_virus_name': 'hCoV-19/Canada/Qc-L00240569/2020',
+                     'covv_accession_id': 'EPI_ISL_465679',
+                     'sequence': 'ACGTACGTACGT',
+                     'covv_collection_date': '2020-03-27',
+                     'covv_lineage': 'B.1'}]
+        self.assertEqual(expected, result)
+
+    def testStreamLocalBadDate(self):
+        headers = ['hCoV-19/Canada/A/2020|EPI_ISL_1|20200327',
+                   'hCoV-19/Canada/B/2020|EPI_ISL_2|2020-W13-5']
+        result = self.stream([(h, 'ACGTACGTACGT') for h in headers],
+                             [(h, 'B.1') for h in headers])
+        self.assertEqual([], result)
+
+    def testStreamLocalShortUnassigned(self):
+        # short genomes do not need a lineage assignment
+        header = 'hCoV-19/Canada/A/2020|EPI_ISL_1|2020-03-27'
+        self.assertEqual([], self.stream([(header, 'ACGT')], []))
+
+    def testStreamLocalUnassigned(self):
+        header = 'hCoV-19/Canada/A/2020|EPI_ISL_1|2020-03-27'
+        with self.assertRaises(SystemExit):
+            self.stream([(header, 'ACGTACGTACGT')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
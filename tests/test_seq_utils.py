@@ -1,4 +1,9 @@
 import unittest
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
 from covizu.utils.seq_utils import *
 from io import StringIO
 
@@ -36,6 +41,68 @@ class TestIterFasta(unittest.TestCase):
         self.assertEqual(self.expected, result)
 
 
+class TestIterFastaScreened(unittest.TestCase):
+    def testIterFastaScreened(self):
+        handle = StringIO(
+            ">hCoV-19/Canada/Qc-L00240569/2020|EPI_ISL_465679|2020-03-27\n"
+            "GGTTTATACCTTCCCAGGTAACAAACCAACCAACTTTCGATCTCTTGTAGATCTGTTCTCTAAACGAACTTTAAAATCTG\n"
+            "TGTGGCTGTCACTCGGCTGCATGCTTAGTGCACTCACGCAGTATAATTAATAACTAATTACTGTCGTTGACAGGACACGA\n"
+            ">hCoV-19/HongKong/HKPU6_2101/2020|EPI_ISL_417178|2020-01-25  \n"
+            "CATCTACAGATACTTGTTTTGCTAACAAACATGCTGATTTTGACACATGGTTTAGCCAGCGTGGTGGTAGTTATACTAAT\n"
+            ">hCoV-19/HongKong/HKU-200723-093/2020|EPI_ISL_497860|2020-01-25\n"
+            "GTAACTCGTCTATCTTCTGCAGGCTGCTTACGGTTTCGTCCGTGTTGCAGCCGATCATCAGCACATCTAGGTTTTGTCCG\n"
+        )
+        headers = []
+
+        def accept(header):
+            headers.append(header)
+            return 'HKPU6' not in header
+
+        expected = [
+            ('hCoV-19/Canada/Qc-L00240569/2020|EPI_ISL_465679|2020-03-27',
+             'GGTTTATACCTTCCCAGGTAACAAACCAACCAACTTTCGATCTCTTGTAGATCTGTTCTCTAAACGAACTTTAAAATCTG'
+             'TGTGGCTGTCACTCGGCTGCATGCTTAGTGCACTCACGCAGTATAATTAATAACTAATTACTGTCGTTGACAGGACACGA'),
+            ('hCoV-19/HongKong/HKU-200723-093/2020|EPI_ISL_497860|2020-01-25',
+             'GTAACTCGTCTATCTTCTGCAGGCTGCTTACGGTTTCGTCCGTGTTGCAGCCGATCATCAGCACATCTAGGTTTTGTCCG')
+        ]
+        result = list(iter_fasta_screened(handle, accept))
+        self.assertEqual(expected, result)
+        self.assertEqual(3, len(headers))  # every header is screened once
+        self.assertEqual('hCoV-19/HongKong/HKPU6_2101/2020|EPI_ISL_417178|2020-01-25', headers[1])
+
+
+class TestOpenFasta(unittest.TestCase):
+    def setUp(self):
+        self.fasta = ">NC_045512.2\nATTAAAGGTTTATACCTTCC\n>NC_045512.3\nCTTGGTACACGGAACGTTCT\n"
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testOpenFasta(self):
+        path = os.path.join(self.tmpdir.name, 'test.fa')
+        with open(path, 'w') as handle:
+            handle.write(self.fasta)
+        with open_fasta(path) as handle:
+            self.assertEqual(self.fasta, handle.read())
+
+    @unittest.skipUnless(shutil.which('xzcat'), "requires xzcat")
+    def testOpenFastaXZ(self):
+        path = os.path.join(self.tmpdir.name, 'test.fa.xz')
+        with lzma.open(path, 'wt') as handle:
+            handle.write(self.fasta)
+        with open_fasta(path) as handle:
+            self.assertEqual(self.fasta, handle.read())
+
+    @unittest.skipUnless(shutil.which('pigz'), "requires pigz")
+    def testOpenFastaGZ(self):
+        path = os.path.join(self.tmpdir.name, 'test.fa.gz')
+        with gzip.open(path, 'wt') as handle:
+            handle.write(self.fasta)
+        with open_fasta(path) as handle:
+            self.assertEqual(self.fasta, handle.read())
+
+
 class TestConvertFasta(unittest.TestCase):
     def setUp(self):
         self.expected = \